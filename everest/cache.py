@@ -0,0 +1,150 @@
+"""
+On disk cache of blocks of trials.
+
+Reports often get rerun with exactly the same model, seed and trials,
+so there is no need to generate the trials all over again.
+
+Blocks are content addressed: the key is a hash of everything that
+goes into generating them.  See Everest.block_key().
+
+Each block is a file in the cache folder, named by its key.  The file
+starts with the sha256 hex digest of the rest of the file, which is
+checked every time the block is read.  Blocks that fail the check are
+thrown away, so they just get generated again.
+
+Blocks are pickled trials, so reading one means unpickling every
+trial: the saving is in not generating them.  The cache is kept under
+max_bytes by removing the least recently used blocks.
+"""
+import os
+import pickle
+import hashlib
+import tempfile
+
+DIGEST_SIZE = 64
+
+
+def hash_key(*args):
+    """ Return hex digest for a key made up of args """
+    return hashlib.sha256(repr(args).encode('utf-8')).hexdigest()
+
+
+class TrialCache(object):
+    """ Least recently used cache of blocks of trials in a folder
+
+    folder: where to keep the blocks, created if need be.
+
+    max_bytes: maximum total size of the blocks, None for no limit.
+    """
+    def __init__(self, folder, max_bytes=None):
+
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, key):
+        """ Return path to file for key """
+        return os.path.join(self.folder, key + '.trials')
+
+    def get(self, key):
+        """ Return cached trials for key, or None if not cached """
+        path = self.path(key)
+        try:
+            infile = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+
+        with infile:
+            try:
+                trials = self.load(infile)
+            except Exception:
+                # digest matched, but could not unpickle, eg an event
+                # class has moved since the block was saved
+                trials = None
+
+        if trials is None:
+            # corrupt, forget about it
+            self.remove(key)
+            return None
+
+        # mark as recently used
+        os.utime(path)
+
+        return trials
+
+    def load(self, infile):
+        """ Return trials from open file, None if digest is wrong """
+        digest = infile.read(DIGEST_SIZE).decode('ascii', 'replace')
+        payload = infile.read()
+
+        if hashlib.sha256(payload).hexdigest() != digest:
+            return None
+
+        return pickle.loads(payload)
+
+    def put(self, key, trials):
+        """ Save trials for key, then evict old blocks if need be """
+        payload = pickle.dumps(trials, pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.sha256(payload).hexdigest().encode('ascii')
+
+        # write to a temporary file and rename, so readers never see
+        # half a block.
+        fd, tmp = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as outfile:
+                outfile.write(digest)
+                outfile.write(payload)
+
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+        self.evict(keep=key)
+
+    def remove(self, key):
+        """ Remove block for key """
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def blocks(self):
+        """ Return list of (last used, size, path) for cached blocks """
+        blocks = []
+        for entry in os.scandir(self.folder):
+            if not entry.name.endswith('.trials'):
+                continue
+            stat = entry.stat()
+            blocks.append((stat.st_mtime, stat.st_size, entry.path))
+
+        return blocks
+
+    def size(self):
+        """ Return total size of cached blocks """
+        return sum(x[1] for x in self.blocks())
+
+    def evict(self, keep=None):
+        """ Remove least recently used blocks until under max_bytes
+
+        keep: key of a block never to remove, eg the one just saved.
+        Modification times can be coarse, so it might not sort last.
+        """
+        if self.max_bytes is None:
+            return
+
+        blocks = sorted(self.blocks())
+        total = sum(x[1] for x in blocks)
+
+        keep = None if keep is None else self.path(keep)
+        for used, size, path in blocks:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,186 @@
+"""
+Convergence tracking for adaptive runs.
+
+Rather than guessing how many trials are needed, give Everest some
+targets: things to estimate from the trials, such as the mean annual
+count for a hill, or a 1-in-200 return level.
+
+Trials are generated in blocks and each target keeps a running
+estimate along with a confidence interval.  Once every target's
+interval is narrow enough, relative to its estimate, the run stops.
+
+>>> targets = [MeanTarget('eu_ws', hill_count('eu_ws')),
+...            ReturnLevelTarget('eu_ws_200', hill_count('eu_ws'), 200)]
+>>> result = everest.run_until_converged(targets, rtol=0.01)
+>>> result['trials']
+"""
+import abc
+
+import numpy as np
+
+# two sided 95% normal quantile
+Z95 = 1.959963984540054
+
+
+def hill_count(hill):
+    """ Return a measure: number of events for hill in a trial """
+    def measure(trial):
+        return len(trial.get(hill, {}).get('events', ()))
+
+    return measure
+
+
+class Target(abc.ABC):
+    """ Something to estimate from the trials.
+
+    name: label for the target in results.
+
+    measure: callable, given a trial returns a number.
+
+    z: normal quantile used for the confidence interval.
+
+    Subclasses keep whatever running statistics they need in add().
+    """
+    def __init__(self, name, measure, z=Z95):
+
+        self.name = name
+        self.measure = measure
+        self.z = z
+        self.count = 0
+
+    def update(self, trials):
+        """ Add the values for a block of trials """
+        values = np.fromiter(
+            (self.measure(trial) for trial in trials), np.float64)
+
+        self.add(values)
+        self.count += len(values)
+
+    @abc.abstractmethod
+    def add(self, values):
+        """ Add array of values to the running statistics """
+
+    @abc.abstractmethod
+    def estimate(self):
+        """ Return current estimate """
+
+    @abc.abstractmethod
+    def halfwidth(self):
+        """ Return half width of the confidence interval """
+
+    def converged(self, rtol):
+        """ True if confidence interval is within rtol of estimate """
+        if not self.count:
+            return False
+
+        return self.halfwidth() <= rtol * abs(self.estimate())
+
+    def summary(self):
+        """ Return dictionary with estimate and interval """
+        return dict(estimate=self.estimate(),
+                    halfwidth=self.halfwidth(),
+                    trials=self.count)
+
+
+class MeanTarget(Target):
+    """ Mean of the measure over trials.
+
+    Trials are independent, so the standard error is just the
+    sample standard deviation over sqrt(n).
+
+    Keeps a running mean and sum of squared deviations, combining
+    each block with those so far (Chan et al's update of Welford).
+    """
+    def __init__(self, name, measure, z=Z95):
+
+        super().__init__(name, measure, z)
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, values):
+
+        n = len(values)
+        if n == 0:
+            return
+
+        mean = values.mean()
+        m2 = ((values - mean) ** 2).sum()
+
+        total = self.count + n
+        delta = mean - self.mean
+
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.count * n / total
+
+    def estimate(self):
+
+        return self.mean
+
+    def halfwidth(self):
+
+        if self.count < 2:
+            return np.inf
+
+        sd = np.sqrt(self.m2 / (self.count - 1))
+
+        return self.z * sd / np.sqrt(self.count)
+
+
+class ReturnLevelTarget(Target):
+    """ Return level of the measure, eg 1 in 200 years.
+
+    This is the (1 - 1/period) quantile of the measure.
+
+    Confidence interval uses order statistics: the number of values
+    below the true quantile is binomial, which gives a pair of ranks
+    bracketing it without any assumption about the distribution.
+
+    Quantiles need all the values, which are kept in a numpy array
+    that doubles in size as it fills.
+    """
+    def __init__(self, name, measure, period, z=Z95):
+
+        super().__init__(name, measure, z)
+        self.period = period
+        self.q = 1.0 - 1.0 / period
+        self.store = np.empty(1024)
+
+    @property
+    def values(self):
+        """ Array of values so far """
+        return self.store[:self.count]
+
+    def add(self, values):
+
+        need = self.count + len(values)
+        if need > len(self.store):
+            store = np.empty(max(need, 2 * len(self.store)))
+            store[:self.count] = self.values
+            self.store = store
+
+        self.store[self.count:need] = values
+
+    def ranks(self):
+        """ Return (low, high) ranks bracketing the quantile """
+        n = self.count
+        spread = self.z * np.sqrt(n * self.q * (1 - self.q))
+
+        low = int(np.floor(n * self.q - spread))
+        high = int(np.ceil(n * self.q + spread))
+
+        return low, high
+
+    def estimate(self):
+
+        return np.quantile(self.values, self.q)
+
+    def halfwidth(self):
+
+        low, high = self.ranks()
+        if low < 0 or high >= self.count:
+            # not enough trials to see past the return level
+            return np.inf
+
+        values = np.partition(self.values, (low, high))
+
+        return (values[high] - values[low]) / 2.0
@@ -65,8 +65,12 @@ FIXME: add a license file
 GPL v 3
 """
 import os
+import abc
+import copy
 import json
+import time
 from collections import defaultdict
+from concurrent import futures
 
 import pandas as pd
 import numpy as np
@@ -74,15 +78,24 @@ import numpy as np
 import networkx as nx
 
 from everest import utils
+from everest import cache
+from everest import rng
 
 class Everest(object):
     """ A mountain of events
 
     The events come from separate hills, or EventGenerators.
     """
-    def __init__(self):
-        """ Initialise Everest """
+    def __init__(self, bit_generator=rng.LEGACY):
+        """ Initialise Everest
+
+        bit_generator: rng.LEGACY to reproduce results from RandomState
+        seeding, or one of rng.BIT_GENERATORS.
+        """
+        rng.check_bit_generator(bit_generator)
+
         self.hills = defaultdict(list)
+        self.bit_generator = bit_generator
         
     def load(self, data):
         """ Load a model
@@ -90,6 +103,11 @@ class Everest(object):
         Data is a list of dictionaries.
 
         Each dictionary describes a part of the model.
+
+        Where a hill has more than one choice, each trial picks one of
+        them.  An optional weight in each dictionary gives how often
+        that choice is picked, relative to the others for the hill.
+        Default weight is 1.
         """
         for item in data:
 
@@ -99,10 +117,42 @@ class Everest(object):
 
             hill = clazz(item)
 
+            if hill.weight < 0:
+                raise ValueError("weight for %s should be >= 0" %
+                                 hill.full_name())
+
             self.hills[hill.short_name()].append(hill)
 
+        self.build_choice_tables()
         self.build_graph()
 
+    def build_choice_tables(self):
+        """ Work out weights and cumulative weights for each hill
+
+        choice_tables maps each hill to (weights, cumulative weights
+        normalised to end at 1, True if the weights are not all equal).
+        """
+        self.choice_tables = {}
+        for hill, choices in self.hills.items():
+            if not choices:
+                continue
+
+            weights = np.array([choice.weight for choice in choices],
+                               np.float64)
+            if not weights.sum() > 0:
+                raise ValueError("weights for %s should not all be 0" % hill)
+
+            cumulative = np.cumsum(weights)
+            cumulative /= cumulative[-1]
+
+            self.choice_tables[hill] = (
+                weights, cumulative, bool((weights != weights[0]).any()))
+
+        # legacy seeding keeps picking with randint unless weights are used
+        self.legacy_randint = not any(
+            weighted for weights, cumulative, weighted
+            in self.choice_tables.values())
+
     def dump(self):
         """ Dump out current model """
         print(self.hills)
@@ -126,6 +176,9 @@ class Everest(object):
 
         for hill, data in self.hills.items():
 
+            # hills with no inputs still need to be generated
+            graph.add_node(hill)
+
             for item in data:
                 for link in item.inputs:
                     graph.add_edge(link, hill)
@@ -136,24 +189,129 @@ class Everest(object):
         if not is_dag:
             raise ValueError("hills must be acyclic")
 
-        self.hill_order = nx.topological_sort(
-            graph)
+        self.graph = graph
+        self.hill_order = list(nx.topological_sort(
+            graph))
 
 
     def seed(self, seed):
         """ Seed random number generators """
-        self.random = np.random.RandomState(seed)
+        self.last_seed = seed
+        self.seed_states(seed)
 
-        for hill, choice, ix in self.walk_hills():
-            # include the hill and choice index in the seed
-            # to avoid identical seeding for different hills.
-            full_seed = [seed, ix] + [ord(x) for x in ''.join(hill)]
-            choice.seed(full_seed)
+    def seed_states(self, seed):
+        """ Seed random states of Everest and all the hills
+
+        Bit generators get a SeedSequence stream for each hill choice,
+        spawned from the seed, the hill and the choice index.  Each
+        hill also gets its own stream for picking between its choices,
+        so hills are independent of each other.
+
+        With legacy seeding, choices are picked with Everest's random
+        state.
+        """
+        self.hill_random = {}
+        if self.bit_generator == rng.LEGACY:
+            self.random = rng.make_random(seed)
+
+            for hill, choice, ix in self.walk_hills():
+                # include the hill and choice index in the seed
+                # to avoid identical seeding for different hills.
+                full_seed = [seed, ix] + [ord(x) for x in ''.join(hill)]
+                choice.seed(full_seed)
+            return
+
+        self.random = rng.make_random(
+            np.random.SeedSequence(seed), self.bit_generator)
 
-    def initialise(self):
-        """ Initialise all the hills """
         for hill, choice, ix in self.walk_hills():
-            choice.initialise()
+            choice.seed(rng.child_seed(seed, hill, ix), self.bit_generator)
+
+        for hill in self.hills:
+            self.hill_random[hill] = rng.make_random(
+                rng.child_seed(seed, hill), self.bit_generator)
+
+    def random_states(self):
+        """ Return copy of all the random states """
+        return copy.deepcopy(dict(
+            random=self.random,
+            hill_random=self.hill_random,
+            choices=[choice.random for hill, choice, ix
+                     in self.walk_hills()]))
+
+    def set_random_states(self, states):
+        """ Put back random states from random_states() """
+        self.random = states['random']
+        self.hill_random = states['hill_random']
+        for (hill, choice, ix), random in zip(self.walk_hills(),
+                                              states['choices']):
+            choice.random = random
+
+    def choice_random(self, hill):
+        """ Return random state for picking between choices for hill """
+        return self.hill_random.get(hill, self.random)
+
+    def initialise(self, max_workers=1, processes=False):
+        """ Initialise all the hills
+
+        Hill choices are independent, so they can be initialised
+        concurrently.
+
+        max_workers: how many choices to initialise at once.
+
+        processes: if True use a pool of processes, otherwise threads.
+
+        With max_workers of 1, choices are initialised in place, one
+        after another, as they always were.
+
+        Otherwise each choice is initialised on a copy, and the copies
+        only replace the originals once all of them have succeeded, so
+        a failure leaves the hills unchanged.
+
+        Either way, if any choice fails, including failing to be
+        copied, a RuntimeError is raised naming all the failures.
+
+        Returns dictionary of load time in seconds for each (hill, ix),
+        also saved as load_times.
+        """
+        hills = list(self.walk_hills())
+
+        if max_workers == 1:
+            results = []
+            for hill, choice, ix in hills:
+                try:
+                    results.append(initialise_choice(choice))
+                except Exception as error:
+                    results.append(error)
+        else:
+            # processes get a copy anyway, when the choice is pickled
+            if processes:
+                pool = futures.ProcessPoolExecutor(max_workers)
+            else:
+                pool = futures.ThreadPoolExecutor(max_workers)
+
+            with pool:
+                jobs = [pool.submit(initialise_choice, choice,
+                                    not processes)
+                        for hill, choice, ix in hills]
+                futures.wait(jobs)
+
+            results = [job.exception() or job.result() for job in jobs]
+
+        failed = [(hill, ix, error)
+                  for (hill, choice, ix), error in zip(hills, results)
+                  if isinstance(error, BaseException)]
+        if failed:
+            raise RuntimeError(
+                "failed to initialise: %s" % ', '.join(
+                    '%s[%d] (%r)' % x for x in failed)) from failed[0][2]
+
+        self.load_times = {}
+        for (hill, choice, ix), (initialised, seconds) in zip(hills, results):
+            self.hills[hill][ix] = initialised
+            self.load_times[(hill, ix)] = seconds
+
+        return self.load_times
 
     def walk_hills(self):
         """ Walk through all the hills """
@@ -162,7 +320,8 @@ class Everest(object):
                 yield (hill, choice, ix)
 
     def generate_trials(self, start=0, end=1000,
-                        start_time=None, end_time=None):
+                        start_time=None, end_time=None,
+                        sampling=None):
         """ Generate trials of events.
 
         Each trial covers a period from start_time to end_time.
@@ -175,30 +334,369 @@ class Everest(object):
         start: datetime object, default datetime.datetime.now()
 
         end: datetime object, defauilt datetime.datetime.now + 1 year  
+
+        sampling: None for plain Monte Carlo, or one of SAMPLING for
+        variance reduced sampling across the trials from start to end.
+        See sample_draws().
         """
-        for trial in range(start, end):
+        if sampling is None:
+            # draw the choices a block at a time
+            for block_start in range(start, end, CHOICE_BLOCK):
+                n = min(CHOICE_BLOCK, end - block_start)
+                draws = self.choice_draws(n)
+                for ix in range(n):
+                    yield self.generate_trial(
+                        start_time, end_time,
+                        trial_draws(draws, ix))
+            return
+
+        draws = self.sample_draws(end - start, sampling)
+        for ix in range(end - start):
             yield self.generate_trial(
-                start_time, end_time)
+                start_time, end_time,
+                trial_draws(draws, ix))
+
+    def generate_block(self, start=0, end=1000,
+                       start_time=None, end_time=None,
+                       sampling=None):
+        """ Generate a block of trials, along with the choices made
+
+        Returns (trials, choices): trials is a list of trials as from
+        generate_trials() and choices is a dictionary with an array for
+        each hill giving the index of the choice used in each trial.
+
+        choice_names(hill)[choices[hill]] gives the names.
+        """
+        n = end - start
+        if sampling is None:
+            draws = self.choice_draws(n)
+        else:
+            draws = self.sample_draws(n, sampling)
+
+        trials = [self.generate_trial(start_time, end_time,
+                                      trial_draws(draws, ix))
+                  for ix in range(n)]
+
+        choices = dict((hill, which) for hill, (which, u) in draws.items())
+
+        return trials, choices
+
+    def choice_names(self, hill):
+        """ Return array of full names of the choices for hill """
+        return np.array([choice.full_name() for choice in self.hills[hill]])
+
+    def choice_weights(self, hill):
+        """ Return array of weights of the choices for hill """
+        return self.choice_tables[hill][0]
+
+    def weighted(self, hill):
+        """ True if choices for hill do not all have the same weight """
+        return self.choice_tables[hill][2]
+
+    def pick_choices(self, hill, u):
+        """ Return choice indices for hill, given uniforms u """
+        cumulative = self.choice_tables[hill][1]
+
+        return np.minimum(np.searchsorted(cumulative, u, side='right'),
+                          len(cumulative) - 1)
+
+    def choice_draws(self, n, hills=None):
+        """ Draw hill choices for a block of n trials
+
+        Returns a dictionary like sample_draws(), with None for the
+        count uniforms.
+
+        hills: optional collection of hills to draw for, default all.
+
+        These are the same draws, in the same order, as picking a
+        choice for one hill and trial at a time with generate_trial().
+        With legacy seeding and no weights, choices are picked with
+        randint, as they always were.
+        """
+        hills = [hill for hill in self.hill_order
+                 if self.hills[hill] and (hills is None or hill in hills)]
+
+        draws = {}
+        if not hills:
+            return draws
+
+        if self.bit_generator == rng.LEGACY:
+            # one shared random state, drawn trial by trial
+            if self.legacy_randint:
+                sizes = [len(self.hills[hill]) for hill in hills]
+                which = self.random.randint(0, sizes, size=(n, len(hills)))
+            else:
+                u = self.random.random_sample((n, len(hills)))
+                which = np.column_stack([
+                    self.pick_choices(hill, u[:, column])
+                    for column, hill in enumerate(hills)])
+
+            for column, hill in enumerate(hills):
+                draws[hill] = (which[:, column], None)
+            return draws
+
+        for hill in hills:
+            u = self.choice_random(hill).random_sample(n)
+            draws[hill] = (self.pick_choices(hill, u), None)
+
+        return draws
+
+    def model_key(self):
+        """ Return hash of the loaded model
+
+        Covers each choice's class, full name and parameters.
+        """
+        model = []
+        for hill, choice, ix in self.walk_hills():
+            model.append((hill, ix) + choice_key(choice))
+
+        return cache.hash_key(sorted(model))
+
+    def affected_hills(self, previous):
+        """ Return hills that change going from previous to this model
+
+        These are hills whose choices differ, together with all the
+        hills downstream of them.
+        """
+        changed = set()
+        for hill in set(self.graph) | set(previous.hills):
+            old = [choice_key(x) for x in previous.hills.get(hill, [])]
+            new = [choice_key(x) for x in self.hills.get(hill, [])]
+            if old != new:
+                changed.add(hill)
+
+        affected = set(changed)
+        for hill in changed:
+            if hill in self.graph:
+                affected |= nx.descendants(self.graph, hill)
+
+        return affected
+
+    def rerun(self, previous, trials,
+              start_time=None, end_time=None,
+              sampling=None):
+        """ Rerun trials for a changed model, only regenerating what changed
+
+        previous: the Everest that generated trials.
+
+        trials: list of trials from previous.generate_trials(), called
+        straight after seeding, with the same start_time, end_time and
+        sampling.
+
+        This Everest should be loaded with the changed model, seeded
+        with the same seed and initialised.
+
+        Hills not affected by the change are reused from trials, the
+        rest are generated again.  Each hill has its own random
+        streams, so the results are identical to generating all the
+        trials with this model.  That needs a bit generator: legacy
+        seeding shares one random state across the hills.
+        """
+        if self.bit_generator == rng.LEGACY:
+            raise ValueError("rerun needs a bit generator, not legacy seeding")
+
+        if ((self.bit_generator, self.last_seed) !=
+                (previous.bit_generator, previous.last_seed)):
+            raise ValueError("rerun needs the same seed and bit generator")
+
+        affected = self.affected_hills(previous)
+
+        if sampling is None:
+            draws = self.choice_draws(len(trials), affected)
+        else:
+            draws = self.sample_draws(len(trials), sampling, affected)
+
+        for ix, trial in enumerate(trials):
+            reuse = dict((hill, trial[hill]) for hill in self.hill_order
+                         if hill not in affected and hill in trial)
+
+            yield self.generate_trial(start_time, end_time,
+                                      trial_draws(draws, ix), reuse)
+
+    def block_key(self, start, end,
+                  start_time=None, end_time=None,
+                  sampling=None):
+        """ Return key for a block of trials from start to end-1 """
+        return cache.hash_key(
+            self.model_key(), self.bit_generator, self.last_seed,
+            start, end,
+            start_time, end_time, sampling)
+
+    def generate_cached_trials(self, trial_cache, start=0, end=1000,
+                               start_time=None, end_time=None,
+                               sampling=None, block_size=1000):
+        """ Generate trials, using blocks from trial_cache where we can.
+
+        Trials are generated in blocks of block_size, aligned to
+        multiples of block_size.  Blocks missing from the cache are
+        generated and saved.
+
+        So that a block can be generated without the ones before it,
+        random states are seeded at the start of each block from the
+        seed and the block's first trial.  This means trials differ
+        from those of generate_trials for the same seed.
+
+        Random states are put back as they were after generating a
+        block, so later calls give the same trials whether or not the
+        cache had the blocks.
+        """
+        seed = self.last_seed
+        for block_start in range(start - start % block_size, end,
+                                 block_size):
+            block_end = block_start + block_size
+            key = self.block_key(block_start, block_end,
+                                 start_time, end_time, sampling)
+
+            trials = trial_cache.get(key)
+            if trials is None:
+                states = self.random_states()
+                try:
+                    self.seed_states(
+                        int(cache.hash_key(seed, block_start)[:8], 16))
+                    trials = list(self.generate_trials(
+                        block_start, block_end,
+                        start_time, end_time, sampling))
+                finally:
+                    self.set_random_states(states)
+
+                trial_cache.put(key, trials)
+
+            first = max(start, block_start) - block_start
+            last = min(end, block_end) - block_start
+            for trial in trials[first:last]:
+                yield trial
+
+    def sample_draws(self, n, sampling, hills=None):
+        """ Draw hill choices and count uniforms for a block of n trials
+
+        Returns a dictionary: for each hill, a pair of arrays with the
+        choice index and the uniform for the number of events, one
+        entry per trial.
+
+        hills: optional collection of hills to draw for, default all.
+
+        Choice indices come from the hill's random state, see
+        choice_random().  Each choice then draws uniforms, from its own
+        random state, for the trials that picked it.  Counts come from
+        those uniforms via the choice's inverse cdf.
+
+        With 'stratified' sampling each set of uniforms has exactly one
+        value in each of the intervals [i/m, (i + 1)/m), in random
+        order.  Since every hill and choice is stratified
+        independently, this is a Latin hypercube across them.
+
+        With 'antithetic' sampling the second half of each set of
+        uniforms is 1 - u for the first half.
+        """
+        draws = {}
+        for hill in self.hill_order:
+            choices = self.hills[hill]
+            if not choices:
+                continue
+            if hills is not None and hill not in hills:
+                continue
+
+            u = sample_uniforms(self.choice_random(hill), n, sampling)
+            which = self.pick_choices(hill, u)
+
+            count_u = np.empty(n)
+            for ix, choice in enumerate(choices):
+                picked = (which == ix)
+                count_u[picked] = sample_uniforms(
+                    choice.random, picked.sum(), sampling)
+
+            draws[hill] = (which, count_u)
+
+        return draws
+
+    def run_until_converged(self, targets, rtol=0.01,
+                            block_size=1000, min_trials=1000,
+                            max_trials=1000000,
+                            start_time=None, end_time=None,
+                            sampling=None):
+        """ Generate trials in blocks until all targets converge.
+
+        targets: list of convergence.Target objects to estimate.
+
+        rtol: relative precision required: a target has converged when
+        the half width of its confidence interval is no more than rtol
+        times its estimate.
+
+        block_size: number of trials to generate between checks.
+
+        min_trials, max_trials: bounds on the number of trials.
 
+        sampling: passed on to generate_trials, each block is sampled
+        separately.  Intervals assume independent trials, so are
+        conservative for variance reduced sampling.
+
+        Returns a dictionary with the number of trials used, whether
+        all targets converged and a summary for each target.
+        """
+        trials = 0
+        converged = False
+        while trials < max_trials:
+
+            end = min(trials + block_size, max_trials)
+            block = list(self.generate_trials(
+                trials, end, start_time, end_time, sampling))
+            trials = end
+
+            for target in targets:
+                target.update(block)
+
+            if trials < min_trials:
+                continue
+
+            converged = all(target.converged(rtol) for target in targets)
+            if converged:
+                break
+
+        return dict(
+            trials=trials,
+            converged=converged,
+            targets=dict((target.name, target.summary())
+                         for target in targets))
 
     def generate_trial(self,
-                       start_time=None, end_time=None):
-        """ Generate a single trial """
+                       start_time=None, end_time=None,
+                       draws=None, reuse=None):
+        """ Generate a single trial
+
+        draws: optional dictionary giving the choice index and count
+        uniform to use for each hill.  See sample_draws().
+
+        reuse: optional dictionary of results to use, rather than
+        generate, for some of the hills.
+        """
 
         events = {}
         for hill in self.hill_order:
+            if reuse and hill in reuse:
+                events[hill] = reuse[hill]
+                continue
+
             # pick a hill
             choices = self.hills[hill]
             if not choices:
                 continue
-            
-            which = self.random.randint(len(choices))
+
+            u = None
+            if draws is None:
+                # pick the same way as choice_draws() does for a block
+                random = self.choice_random(hill)
+                if self.bit_generator == rng.LEGACY and self.legacy_randint:
+                    which = random.randint(len(choices))
+                else:
+                    which = self.pick_choices(hill, random.random_sample())
+            else:
+                which, u = draws[hill]
 
             choice = choices[which]
             hill_events = [x for x in
                            choice.generate_trial(
                                start_time, end_time,
-                               events)]
+                               events, u)]
             events[hill] = dict(
                 events=hill_events,
                 name=choice.full_name())
@@ -211,15 +709,21 @@ class EventGenerator(object):
     def __init__(self, parms=None):
 
         self.inputs = []
+        # weight of this choice, relative to others for the same hill
+        self.weight = 1.0
+        self.parms = parms or {}
         if parms:
             self.__dict__.update(parms)
 
         # Set up random state
-        self.random = np.random.RandomState()
+        self.random = rng.make_random()
             
-    def seed(self, seed):
-        """ Seed the random number generator """
-        self.random.seed(seed)
+    def seed(self, seed, bit_generator=rng.LEGACY):
+        """ Seed the random number generator
+
+        bit_generator: see rng.make_random()
+        """
+        self.random = rng.make_random(seed, bit_generator)
 
     def initialise(self):
         """ Do stuff like loading pools of events and their frequencies.
@@ -243,15 +747,37 @@ class EventGenerator(object):
 
         return 0
 
+    def inverse_number_of_events(self, u,
+                                 start_time=None,
+                                 end_time=None,
+                                 events=None):
+        """ Return number of events for uniform u, via the inverse cdf
+
+        Generators that do not know their distribution ignore u and
+        just draw a number of events.
+        """
+        return self.number_of_events(
+            start_time, end_time,
+            events)
+
     def generate_trial(self,
                        start_time=None,
                        end_time=None,
-                       events=None):
-        """  Return a single trial of events """
+                       events=None,
+                       u=None):
+        """  Return a single trial of events
+
+        u: optional uniform to drive the number of events.
+        """
         # Get number of events
-        n = self.number_of_events(
-            start_time, end_time,
-            events)
+        if u is None:
+            n = self.number_of_events(
+                start_time, end_time,
+                events)
+        else:
+            n = self.inverse_number_of_events(
+                u, start_time, end_time,
+                events)
 
         for event in range(n):
             yield self.pick_event()
@@ -278,7 +804,64 @@ class Event(object):
     pass
 
 
-class Poisson(EventGenerator):
+class CountDistribution(EventGenerator, metaclass=abc.ABCMeta):
+    """ Event generator with a known distribution for the number of events
+
+    Subclasses provide log_pmf(k), which is tabulated to give the
+    inverse cdf.
+
+    The table starts at table_size() counts and doubles until the
+    probability left in the tail is below COUNT_TAIL.  If a uniform
+    still lands beyond the table, it keeps doubling until the table
+    covers it, or stops gaining probability.
+    """
+    # probability that may be left beyond the cdf table
+    COUNT_TAIL = 1e-12
+
+    # largest table to build
+    MAX_TABLE = 2 ** 26
+
+    @abc.abstractmethod
+    def log_pmf(self, k):
+        """ Return log probability of k events, k = arange(n) """
+
+    def table_size(self):
+        """ Return initial size of the cdf table """
+        return 100
+
+    def tabulate_cdf(self, size):
+        """ Return cdf of the number of events, from 0 to size - 1 """
+        return np.cumsum(np.exp(self.log_pmf(np.arange(size))))
+
+    def count_cdf(self, u=0.0):
+        """ Return cdf table of the number of events, covering u """
+        cdf = getattr(self, '_count_cdf', None)
+        if cdf is None:
+            cdf = self.tabulate_cdf(self.table_size())
+            u = max(u, 1.0 - self.COUNT_TAIL)
+
+        while cdf[-1] < u and len(cdf) < self.MAX_TABLE:
+            more = self.tabulate_cdf(2 * len(cdf))
+            if more[-1] <= cdf[-1]:
+                # no more probability to be had, rounding
+                break
+            cdf = more
+
+        self._count_cdf = cdf
+
+        return cdf
+
+    def inverse_number_of_events(self, u,
+                                 start_time=None,
+                                 end_time=None,
+                                 events=None):
+        """ Return number of events for uniform u, via the inverse cdf """
+        cdf = self.count_cdf(u)
+
+        return int(min(np.searchsorted(cdf, u, side='right'), len(cdf) - 1))
+
+
+class Poisson(CountDistribution):
 
     def number_of_events(self,
                          start_time=None,
@@ -286,9 +869,24 @@ class Poisson(EventGenerator):
                          events=None):
         """ Return the number of events """
         return self.random.poisson(self.frequency)
-        
 
-class NegativeBinomial(EventGenerator):
+    def log_pmf(self, k):
+        """ Log probability of k events """
+        if self.frequency == 0:
+            # hill switched off, never any events
+            return np.where(k == 0, 0.0, -np.inf)
+
+        log_factorial = np.cumsum(np.log(np.maximum(k, 1)))
+
+        return (k * np.log(self.frequency) - self.frequency
+                - log_factorial)
+
+    def table_size(self):
+
+        return int(self.frequency + 12 * np.sqrt(self.frequency) + 20)
+
+
+class NegativeBinomial(CountDistribution):
 
     def number_of_events(self,
                          start_time=None,
@@ -297,6 +895,84 @@ class NegativeBinomial(EventGenerator):
         """ Number of events per trial """
         return self.random.negative_binomial(self.n, self.p)
 
+    def log_pmf(self, k):
+        """ Log probability of k events, ie failures before n successes """
+        if self.p == 1:
+            # never a failure
+            return np.where(k == 0, 0.0, -np.inf)
+
+        # log of (k + n - 1) choose k, term by term
+        terms = np.zeros(len(k))
+        terms[1:] = np.log(k[1:] + self.n - 1) - np.log(k[1:])
+        log_choose = np.cumsum(terms)
+
+        return self.n * np.log(self.p) + k * np.log1p(-self.p) + log_choose
+
+    def table_size(self):
+
+        mean = self.n * (1 - self.p) / self.p
+        sd = np.sqrt(mean / self.p)
+
+        return int(mean + 12 * sd + 20)
+
+
+# number of trials to draw hill choices for at a time
+CHOICE_BLOCK = 10000
+
+
+def trial_draws(draws, ix):
+    """ Return draws for trial ix from draws for a block of trials """
+    return dict((hill, (which[ix], None if u is None else u[ix]))
+                for hill, (which, u) in draws.items())
+
+
+def choice_key(choice):
+    """ Return class, full name and parameters of a hill choice """
+    clazz = type(choice)
+
+    return (clazz.__module__ + '.' + clazz.__qualname__,
+            choice.full_name(),
+            json.dumps(choice.parms, sort_keys=True, default=repr))
+
+
+def initialise_choice(choice, copy_first=False):
+    """ Initialise a hill choice
+
+    copy_first: if True, initialise a copy and leave choice alone.
+
+    Returns the choice initialised and how long it took in seconds.
+    """
+    if copy_first:
+        choice = copy.deepcopy(choice)
+
+    start = time.perf_counter()
+    choice.initialise()
+
+    return choice, time.perf_counter() - start
+
+
+SAMPLING = ('stratified', 'antithetic')
+
+
+def sample_uniforms(random, n, sampling=None):
+    """ Return n uniforms on [0, 1) from random state random
+
+    sampling: None for independent uniforms, 'stratified' for one
+    uniform in each interval [i/n, (i + 1)/n) in random order, or
+    'antithetic' for pairs u, 1 - u.
+    """
+    if sampling is None:
+        return random.random_sample(n)
+
+    if sampling == 'stratified':
+        return (random.permutation(n) + random.random_sample(n)) / n
+
+    if sampling == 'antithetic':
+        u = random.random_sample((n + 1) // 2)
+        return np.concatenate((u, 1.0 - u))[:n]
+
+    raise ValueError("sampling should be one of %s" % (SAMPLING,))
+
 
 class WeightedEventSampler(object):
     """ Given n objects with weights w_1, ... 2_n select m of them 
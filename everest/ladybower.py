@@ -4,7 +4,8 @@ Reservoir sampling
 import heapq
 
 import numpy as np
-from numpy import random
+
+from everest import rng
 
 class WeightedReservoir(object):
     """ Sampling from a set of items with different weights.
@@ -35,15 +36,17 @@ class WeightedReservoir(object):
     returns values to select
     """
     
-    def __init__(self, data=None, seed=0):
+    def __init__(self, data=None, seed=0, bit_generator=rng.LEGACY):
         """ Initialise sampler
 
         data: iterable with (weight, item) pairs.
 
         seed: random number seed.
+
+        bit_generator: see rng.make_random()
         """
         # initialise the random state
-        self.seed(seed)
+        self.seed(seed, bit_generator)
 
         if data is None:
             return
@@ -56,9 +59,9 @@ class WeightedReservoir(object):
         self.initialise_values(x[1] for x in data)
 
     
-    def seed(self, seed=0):
-        """ Initialise RandomState """
-        self.random = random.RandomState(seed)
+    def seed(self, seed=0, bit_generator=rng.LEGACY):
+        """ Initialise random state """
+        self.random = rng.make_random(seed, bit_generator)
 
     def initialise_weights(self, weights):
         """ Do prep work for weights
@@ -104,7 +107,91 @@ class WeightedReservoir(object):
 
         # return permuted indices
         return(self.random.permutation([x[1] for x in heap]))
-                    
+
+    def isample_many_without_replacement(self, ks, chunk_size=2**20):
+        """ Return samples without replacement for a block of trials
+
+        ks: iterable of sample sizes, one per trial.  Each must be <= n.
+
+        chunk_size: roughly how many random keys to hold in memory at
+        once.  Keys are drawn for a block of trials and a slice of the
+        weights at a time, keeping a running top k for each trial, so
+        memory is about rows * (columns + k) whatever the number of
+        weights.
+
+        Returns (offsets, indices): sample for trial t is
+        indices[offsets[t]:offsets[t + 1]].
+
+        Each trial gets its own independent sample, but the keys for a
+        whole block of trials are drawn and ranked together, rather
+        than doing one pass over the weights per trial.
+
+        Within a trial, indices are ordered by decreasing key.
+        """
+        ks = np.fromiter((k for k in ks), np.int64)
+        n = len(self.weights)
+
+        if len(ks) and ks.max() > n:
+            raise ValueError("Sample size should be <= %d" % n)
+        if len(ks) and ks.min() < 0:
+            raise ValueError("Sample size should be >= 0")
+
+        offsets = np.zeros(len(ks) + 1, np.int64)
+        np.cumsum(ks, out=offsets[1:])
+        indices = np.empty(offsets[-1], np.int64)
+
+        # whole rows of keys if they fit, otherwise share chunk_size
+        # between trials and columns
+        if n <= chunk_size:
+            rows = max(1, chunk_size // max(n, 1))
+        else:
+            rows = max(1, int(np.sqrt(chunk_size)))
+        columns = max(1, chunk_size // rows)
+
+        random = self.random.random_sample
+        for start in range(0, len(ks), rows):
+            block = ks[start:start + rows]
+            kmax = block.max()
+            if kmax == 0:
+                continue
+
+            # running top kmax keys, and their indices, for each trial
+            best_keys = np.empty((len(block), 0))
+            best = np.empty((len(block), 0), np.int64)
+
+            for low in range(0, n, columns):
+                high = min(low + columns, n)
+
+                # log(u) / w ranks the same as u ** (1 / w), without
+                # underflow
+                with np.errstate(divide='ignore'):
+                    keys = np.log(random((len(block), high - low)))
+                    keys /= self.weights[low:high]
+
+                keys = np.concatenate((best_keys, keys), axis=1)
+                picks = np.concatenate(
+                    (best, np.broadcast_to(np.arange(low, high),
+                                           (len(block), high - low))),
+                    axis=1)
+
+                # keep the kmax largest keys in each row
+                if keys.shape[1] > kmax:
+                    top = np.argpartition(-keys, kmax - 1, axis=1)[:, :kmax]
+                    keys = np.take_along_axis(keys, top, axis=1)
+                    picks = np.take_along_axis(picks, top, axis=1)
+
+                best_keys, best = keys, picks
+
+            # now sort them
+            order = np.argsort(-best_keys, axis=1, kind='stable')
+            best = np.take_along_axis(best, order, axis=1)
+
+            # keep the first k of each row
+            mask = np.arange(kmax) < block[:, None]
+            indices[offsets[start]:offsets[start + len(block)]] = best[mask]
+
+        return offsets, indices
+
     def isample_with_replacement(self, k):
         """ Return indices for a sample of size k, with replacement
 
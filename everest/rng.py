@@ -0,0 +1,78 @@
+"""
+Random number generators.
+
+Everest, the hills and WeightedReservoir all get their random states
+from make_random().
+
+By default they use the legacy numpy RandomState, so results are the
+same as they always were.
+
+Alternatively, pick one of the bit generators in BIT_GENERATORS.  This
+gives a numpy Generator, which has faster samplers, and seeding is done
+with a SeedSequence, so each hill gets its own independent stream.
+"""
+import numpy as np
+
+LEGACY = 'legacy'
+
+BIT_GENERATORS = {
+    'pcg64': np.random.PCG64,
+    'philox': np.random.Philox,
+    'sfc64': np.random.SFC64,
+    'mt19937': np.random.MT19937,
+}
+
+
+class Generator(np.random.Generator):
+    """ numpy Generator with the RandomState names used by everest """
+    random_sample = np.random.Generator.random
+    randint = np.random.Generator.integers
+
+    def __reduce__(self):
+        """ Pickle and copy as this class, not numpy's """
+        return (Generator, (self.bit_generator,))
+
+
+def make_random(seed=None, bit_generator=LEGACY):
+    """ Return random state for seed
+
+    seed: anything RandomState accepts or, for bit generators, a
+    SeedSequence.
+
+    bit_generator: LEGACY for RandomState, otherwise a key of
+    BIT_GENERATORS.
+    """
+    if bit_generator == LEGACY:
+        if isinstance(seed, np.random.SeedSequence):
+            seed = seed.generate_state(4)
+        return np.random.RandomState(seed)
+
+    check_bit_generator(bit_generator)
+
+    return Generator(BIT_GENERATORS[bit_generator](seed))
+
+
+def check_bit_generator(bit_generator):
+    """ Raise ValueError unless bit_generator is LEGACY or known """
+    if bit_generator != LEGACY and bit_generator not in BIT_GENERATORS:
+        raise ValueError("bit_generator should be one of %s" % (
+            (LEGACY,) + tuple(sorted(BIT_GENERATORS)),))
+
+
+def spawn_key(name, ix=None):
+    """ Return a SeedSequence spawn key for name and optional index
+
+    Keys depend only on the name and index, so adding or removing
+    other hills does not change a hill's stream.
+    """
+    data = name.encode('utf-8')
+    key = (len(data),) + tuple(data)
+    if ix is not None:
+        key += (ix,)
+
+    return key
+
+
+def child_seed(seed, name, ix=None):
+    """ Return SeedSequence for stream name, ix under seed """
+    return np.random.SeedSequence(seed, spawn_key=spawn_key(name, ix))
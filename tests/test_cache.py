@@ -0,0 +1,139 @@
+""" Trial cache tests """
+import os
+import unittest
+import tempfile
+from unittest import mock
+
+from everest import cache
+
+from tests.test_events import make_everest, counts
+
+
+class TestTrialCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = self.tmp.name
+
+    def tearDown(self):
+
+        self.tmp.cleanup()
+
+    def test_get_put(self):
+
+        trial_cache = cache.TrialCache(self.folder)
+
+        self.assertIsNone(trial_cache.get('x'))
+
+        trial_cache.put('x', [1, 2, 3])
+
+        self.assertEqual(trial_cache.get('x'), [1, 2, 3])
+
+    def test_corrupt(self):
+        """ Corrupt blocks are discarded """
+        trial_cache = cache.TrialCache(self.folder)
+        trial_cache.put('x', [1, 2, 3])
+
+        with open(trial_cache.path('x'), 'r+b') as outfile:
+            outfile.seek(-1, os.SEEK_END)
+            outfile.write(b'!')
+
+        self.assertIsNone(trial_cache.get('x'))
+        self.assertFalse(os.path.exists(trial_cache.path('x')))
+
+    def test_unpickle_failure(self):
+        """ Blocks that no longer unpickle are treated as missing """
+        trial_cache = cache.TrialCache(self.folder)
+        trial_cache.put('x', [1, 2, 3])
+
+        error = ModuleNotFoundError("no module named 'moved'")
+        with mock.patch('pickle.loads', side_effect=error):
+            self.assertIsNone(trial_cache.get('x'))
+
+        self.assertFalse(os.path.exists(trial_cache.path('x')))
+
+    def test_failed_put(self):
+        """ Failed writes leave no temporary files behind """
+        trial_cache = cache.TrialCache(self.folder)
+
+        with mock.patch('os.replace', side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                trial_cache.put('x', [1, 2, 3])
+
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def test_evict(self):
+        """ Least recently used blocks go first """
+        trial_cache = cache.TrialCache(self.folder)
+
+        for key in 'abc':
+            trial_cache.put(key, list(range(100)))
+            os.utime(trial_cache.path(key), (0, 'abc'.index(key)))
+
+        trial_cache.get('a')
+
+        trial_cache.max_bytes = trial_cache.size() - 1
+        trial_cache.evict()
+
+        self.assertIsNone(trial_cache.get('b'))
+        self.assertIsNotNone(trial_cache.get('a'))
+        self.assertIsNotNone(trial_cache.get('c'))
+
+    def test_evict_keeps_new_block(self):
+        """ Block just saved survives, even if its mtime ties """
+        trial_cache = cache.TrialCache(self.folder)
+        trial_cache.put('b', list(range(100)))
+        trial_cache.max_bytes = trial_cache.size()
+
+        def blocks(self):
+            # same mtime and size for all, so 'a' sorts first
+            return sorted((0, 1000, self.path(key)) for key in 'ab'
+                          if os.path.exists(self.path(key)))
+
+        with mock.patch.object(cache.TrialCache, 'blocks', blocks):
+            trial_cache.put('a', list(range(100)))
+
+        self.assertTrue(os.path.exists(trial_cache.path('a')))
+        self.assertFalse(os.path.exists(trial_cache.path('b')))
+
+    def test_generate_cached_trials(self):
+        """ Cached trials match, whatever the range asked for """
+        trial_cache = cache.TrialCache(self.folder)
+
+        everest = make_everest()
+        first = counts(everest.generate_cached_trials(
+            trial_cache, 0, 250, block_size=100))
+        self.assertEqual(len(os.listdir(self.folder)), 3)
+
+        everest = make_everest()
+        again = counts(everest.generate_cached_trials(
+            trial_cache, 50, 300, block_size=100))
+
+        self.assertEqual(first[50:], again[:200])
+        self.assertEqual(len(os.listdir(self.folder)), 3)
+
+        # different seed, different blocks
+        everest = make_everest(seed=1)
+        other = counts(everest.generate_cached_trials(
+            trial_cache, 0, 100, block_size=100))
+
+        self.assertNotEqual(first[:100], other)
+        self.assertEqual(len(os.listdir(self.folder)), 4)
+
+    def test_random_states_restored(self):
+        """ Later trials do not depend on whether the cache had blocks """
+        trial_cache = cache.TrialCache(self.folder)
+        expect = counts(make_everest().generate_trials(end=50))
+
+        for repeat in range(2):
+            everest = make_everest()
+            list(everest.generate_cached_trials(
+                trial_cache, 0, 100, block_size=100))
+
+            self.assertEqual(counts(everest.generate_trials(end=50)), expect)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
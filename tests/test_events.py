@@ -0,0 +1,457 @@
+""" Everest tests """
+import time
+import threading
+import unittest
+
+import numpy as np
+
+from everest import rng
+from everest import events
+from everest import convergence
+
+
+def model():
+    """ A small model: two choices for one hill, another hill downstream """
+    return [
+        {'class': 'everest.events.Poisson',
+         'source': 'a', 'region': 'eu', 'peril': 'ws', 'version': '1',
+         'frequency': 2.0},
+        {'class': 'everest.events.NegativeBinomial',
+         'source': 'b', 'region': 'eu', 'peril': 'ws', 'version': '1',
+         'n': 3, 'p': 0.5},
+        {'class': 'everest.events.Poisson',
+         'source': 'a', 'region': 'us', 'peril': 'hu', 'version': '1',
+         'frequency': 1.0, 'inputs': ['eu_ws']},
+    ]
+
+
+def make_everest(seed=0, bit_generator=rng.LEGACY, data=None,
+                 initialise=True):
+    """ Return a seeded Everest for data, default model() """
+    everest = events.Everest(bit_generator)
+    everest.load(model() if data is None else data)
+    everest.seed(seed)
+    if initialise:
+        everest.initialise()
+
+    return everest
+
+
+def counts(trials):
+    """ Return (number of events, name) for each hill in each trial """
+    return [dict((hill, (len(x['events']), x['name']))
+                 for hill, x in trial.items())
+            for trial in trials]
+
+
+class SlowPoisson(events.Poisson):
+    """ Poisson that takes a while to initialise, or fails """
+
+    def initialise(self):
+
+        time.sleep(self.delay)
+        if self.fail:
+            raise IOError("no events for %s" % self.full_name())
+
+        self.initialised = True
+
+
+def slow_model(delay=0.2, fail=False):
+
+    return [
+        {'class': 'tests.test_events.SlowPoisson',
+         'source': source, 'region': 'eu', 'peril': peril, 'version': '1',
+         'frequency': 1.0, 'delay': delay, 'fail': fail and source == 'b'}
+        for source in 'ab' for peril in ('ws', 'fl')]
+
+
+class TestInitialise(unittest.TestCase):
+
+    def make_everest(self, bit_generator=rng.LEGACY, **kwargs):
+
+        return make_everest(0, bit_generator, slow_model(**kwargs),
+                            initialise=False)
+
+    def test_concurrent(self):
+        """ Bounded by the slowest hill, not the sum """
+        everest = self.make_everest()
+
+        start = time.perf_counter()
+        load_times = everest.initialise(max_workers=4)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(load_times), 4)
+        self.assertLess(elapsed, sum(load_times.values()))
+        for hill, choice, ix in everest.walk_hills():
+            self.assertTrue(choice.initialised)
+
+    def test_processes(self):
+        """ Process pool hands back initialised choices """
+        everest = self.make_everest('pcg64', delay=0)
+
+        expect = [choice.random.random_sample()
+                  for hill, choice, ix in self.make_everest(
+                      'pcg64', delay=0).walk_hills()]
+
+        everest.initialise(max_workers=2, processes=True)
+
+        for hill, choice, ix in everest.walk_hills():
+            self.assertTrue(choice.initialised)
+
+        self.assertEqual(expect, [choice.random.random_sample()
+                                  for hill, choice, ix
+                                  in everest.walk_hills()])
+
+    def test_in_place(self):
+        """ Serial initialisation works on the choices themselves """
+        everest = self.make_everest(delay=0)
+        before = list(everest.walk_hills())
+
+        everest.initialise()
+
+        for hill, choice, ix in before:
+            self.assertIs(everest.hills[hill][ix], choice)
+            self.assertTrue(choice.initialised)
+
+    def test_failure(self):
+        """ Failures are reported and, if concurrent, hills unchanged """
+        for max_workers in (1, 4):
+            everest = self.make_everest(delay=0, fail=True)
+            before = list(everest.walk_hills())
+
+            with self.assertRaises(RuntimeError) as cm:
+                everest.initialise(max_workers=max_workers)
+
+            self.assertIn('eu_ws[1]', cm.exception.args[0])
+            self.assertEqual(before, list(everest.walk_hills()))
+            if max_workers > 1:
+                for hill, choice, ix in everest.walk_hills():
+                    self.assertFalse(hasattr(choice, 'initialised'))
+
+    def test_copy_failure(self):
+        """ Choices that cannot be copied are reported like any failure """
+        for processes in (False, True):
+            everest = self.make_everest(delay=0)
+            everest.hills['eu_ws'][0].lock = threading.Lock()
+
+            with self.assertRaises(RuntimeError) as cm:
+                everest.initialise(max_workers=2, processes=processes)
+
+            self.assertIn('eu_ws[0]', cm.exception.args[0])
+
+
+class TestEverest(unittest.TestCase):
+
+    def test_generate_trials(self):
+        """ Every trial has every hill """
+        everest = make_everest()
+
+        for trial in everest.generate_trials(end=10):
+            self.assertEqual(set(trial), set(['eu_ws', 'us_hu']))
+
+    def test_run_until_converged(self):
+        """ Stops once targets converge, reporting trials used """
+        everest = make_everest()
+
+        targets = [
+            convergence.MeanTarget('us_hu', convergence.hill_count('us_hu')),
+            convergence.ReturnLevelTarget(
+                'us_hu_20', convergence.hill_count('us_hu'), 20)]
+
+        result = everest.run_until_converged(
+            targets, rtol=0.05, block_size=500, min_trials=500)
+
+        self.assertTrue(result['converged'])
+        self.assertLess(result['trials'], 1000000)
+        self.assertEqual(result['trials'] % 500, 0)
+
+        mean = result['targets']['us_hu']
+        self.assertAlmostEqual(mean['estimate'], 1.0, delta=0.1)
+
+    def test_run_until_converged_max_trials(self):
+        """ Gives up at max_trials """
+        everest = make_everest()
+
+        targets = [
+            convergence.MeanTarget('us_hu', convergence.hill_count('us_hu'))]
+
+        result = everest.run_until_converged(
+            targets, rtol=1e-6, block_size=100, min_trials=0, max_trials=250)
+
+        self.assertFalse(result['converged'])
+        self.assertEqual(result['trials'], 250)
+
+
+class TestTargets(unittest.TestCase):
+
+    def test_running_statistics(self):
+        """ Block by block estimates match estimates from all values """
+        values = [x % 7 + x % 3 for x in range(1000)]
+
+        mean = convergence.MeanTarget('mean', float)
+        level = convergence.ReturnLevelTarget('level', float, 20)
+        for start in range(0, 1000, 300):
+            for target in (mean, level):
+                target.update(values[start:start + 300])
+
+        self.assertEqual(mean.count, 1000)
+        self.assertAlmostEqual(mean.estimate(), np.mean(values))
+        self.assertAlmostEqual(
+            mean.halfwidth(),
+            convergence.Z95 * np.std(values, ddof=1) / np.sqrt(1000))
+        self.assertEqual(level.estimate(), np.quantile(values, 0.95))
+
+    def test_abstract(self):
+        """ Targets must say how to estimate """
+        with self.assertRaises(TypeError):
+            convergence.Target('x', float)
+
+
+class TestBitGenerators(unittest.TestCase):
+
+    def test_legacy(self):
+        """ Legacy seeding gives the same trials as it always did
+
+        Will fail if random number generator changes.
+        """
+        trials = make_everest().generate_trials(end=8)
+
+        expect = [
+            ((2, 'a_eu_ws_1'), (1, 'a_us_hu_1')),
+            ((2, 'b_eu_ws_1'), (0, 'a_us_hu_1')),
+            ((3, 'b_eu_ws_1'), (1, 'a_us_hu_1')),
+            ((4, 'a_eu_ws_1'), (1, 'a_us_hu_1')),
+            ((1, 'b_eu_ws_1'), (2, 'a_us_hu_1')),
+            ((0, 'b_eu_ws_1'), (1, 'a_us_hu_1')),
+            ((4, 'b_eu_ws_1'), (2, 'a_us_hu_1')),
+            ((3, 'b_eu_ws_1'), (1, 'a_us_hu_1'))]
+
+        self.assertEqual(counts(trials),
+                         [dict(eu_ws=eu_ws, us_hu=us_hu)
+                          for eu_ws, us_hu in expect])
+
+    def test_reproducible(self):
+        """ Same seed and bit generator, same trials """
+        for bit_generator in rng.BIT_GENERATORS:
+            for sampling in (None,) + events.SAMPLING:
+                trials = [counts(make_everest(3, bit_generator)
+                                 .generate_trials(end=100,
+                                                  sampling=sampling))
+                          for repeat in range(2)]
+                self.assertEqual(trials[0], trials[1])
+
+    def test_streams(self):
+        """ Each hill choice gets its own stream """
+        everest = make_everest(0, 'pcg64')
+
+        draws = set(choice.random.random_sample()
+                    for hill, choice, ix in everest.walk_hills())
+
+        self.assertEqual(len(draws), 3)
+
+    def test_invalid_bit_generator(self):
+        """ Unknown bit generators are rejected straight away """
+        with self.assertRaises(ValueError):
+            events.Everest('lcg')
+
+
+class TestRerun(unittest.TestCase):
+
+    def everest(self, data):
+
+        return make_everest(5, 'pcg64', data)
+
+    def check_rerun(self, changed, sampling=None):
+        """ Rerun matches a full run with the changed model """
+        previous = self.everest(model())
+        trials = list(previous.generate_trials(end=100, sampling=sampling))
+
+        everest = self.everest(changed)
+        rerun = list(everest.rerun(previous, trials, sampling=sampling))
+
+        full = list(self.everest(changed).generate_trials(
+            end=100, sampling=sampling))
+
+        self.assertEqual(counts(rerun), counts(full))
+
+        return everest.affected_hills(previous), trials, rerun
+
+    def test_downstream_change(self):
+        """ Only the changed hill is regenerated """
+        changed = model()
+        changed[2]['frequency'] = 5.0
+
+        for sampling in (None, 'stratified'):
+            affected, trials, rerun = self.check_rerun(changed, sampling)
+
+            self.assertEqual(affected, set(['us_hu']))
+            for old, new in zip(trials, rerun):
+                self.assertIs(old['eu_ws'], new['eu_ws'])
+
+    def test_upstream_change(self):
+        """ Changes flow downstream """
+        changed = model()
+        changed[0]['frequency'] = 5.0
+
+        affected, trials, rerun = self.check_rerun(changed)
+
+        self.assertEqual(affected, set(['eu_ws', 'us_hu']))
+
+    def test_new_hill(self):
+        """ Adding a hill leaves the others alone """
+        changed = model() + [
+            {'class': 'everest.events.Poisson',
+             'source': 'a', 'region': 'jp', 'peril': 'eq', 'version': '1',
+             'frequency': 0.5}]
+
+        affected, trials, rerun = self.check_rerun(changed)
+
+        self.assertEqual(affected, set(['jp_eq']))
+
+    def test_legacy(self):
+
+        previous = make_everest()
+        everest = make_everest()
+
+        with self.assertRaises(ValueError):
+            list(everest.rerun(previous, []))
+
+
+class TestWeights(unittest.TestCase):
+
+    def weighted_model(self, weights):
+
+        data = model()
+        for item, weight in zip(data, weights):
+            item['weight'] = weight
+
+        return data
+
+    def make_everest(self, weights, bit_generator=rng.LEGACY):
+
+        return make_everest(0, bit_generator, self.weighted_model(weights))
+
+    def test_weights(self):
+        """ Choices picked in proportion to their weights """
+        for bit_generator in (rng.LEGACY, 'pcg64'):
+            for sampling in (None, 'stratified'):
+                everest = self.make_everest((7, 3), bit_generator)
+
+                trials, choices = everest.generate_block(
+                    end=1000, sampling=sampling)
+
+                which = choices['eu_ws']
+                self.assertAlmostEqual((which == 0).mean(), 0.7, delta=0.05)
+
+                # choice arrays match the trials
+                names = everest.choice_names('eu_ws')[which]
+                self.assertEqual(
+                    list(names), [x['eu_ws']['name'] for x in trials])
+
+    def test_zero_weight(self):
+        """ Zero weight choices are never picked """
+        everest = self.make_everest((0, 1))
+
+        names = set(trial['eu_ws']['name']
+                    for trial in everest.generate_trials(end=200))
+
+        self.assertEqual(names, set(['b_eu_ws_1']))
+
+    def test_block_matches_trials(self):
+        """ generate_block gives the same trials as generate_trials """
+        everest = self.make_everest((2, 1))
+        trials = [trial['eu_ws']['name']
+                  for trial in everest.generate_trials(end=100)]
+
+        everest = self.make_everest((2, 1))
+        block, choices = everest.generate_block(end=100)
+
+        self.assertEqual(trials, [trial['eu_ws']['name'] for trial in block])
+
+    def test_single_trials(self):
+        """ generate_trial one at a time matches generate_trials """
+        for bit_generator in (rng.LEGACY, 'pcg64'):
+            for weights in ((1, 1), (2, 1)):
+                everest = self.make_everest(weights, bit_generator)
+                expect = counts(everest.generate_trials(end=50))
+
+                everest = self.make_everest(weights, bit_generator)
+                trials = [everest.generate_trial() for trial in range(50)]
+
+                self.assertEqual(counts(trials), expect)
+
+    def test_invalid_weights(self):
+
+        for weights in ((-1, 1), (0, 0)):
+            with self.assertRaises(ValueError):
+                self.make_everest(weights)
+
+
+class TestSampling(unittest.TestCase):
+
+    def test_reproducible(self):
+        """ Same seed, same trials """
+        for sampling in events.SAMPLING:
+            trials = [counts(make_everest(1).generate_trials(
+                end=200, sampling=sampling)) for repeat in range(2)]
+            self.assertEqual(trials[0], trials[1])
+
+    def test_stratified_choices(self):
+        """ Stratified hill choice splits trials evenly over choices """
+        everest = make_everest()
+
+        names = [trial['eu_ws']['name']
+                 for trial in everest.generate_trials(
+                     end=200, sampling='stratified')]
+
+        self.assertEqual(names.count('a_eu_ws_1'), 100)
+        self.assertEqual(names.count('b_eu_ws_1'), 100)
+
+    def test_inverse_number_of_events(self):
+        """ Inverse cdf is monotone and covers the distribution """
+        poisson = events.Poisson(dict(frequency=2.0))
+
+        counts = [poisson.inverse_number_of_events(u)
+                  for u in (0.0, 0.1, 0.5, 0.9, 0.999999)]
+
+        self.assertEqual(counts, sorted(counts))
+        self.assertEqual(counts[0], 0)
+        self.assertEqual(counts[2], 2)
+
+    def test_count_tail(self):
+        """ cdf table covers all but a tiny tail """
+        for n, p in ((0.5, 0.01), (0.2, 0.05), (0.1, 0.001)):
+            generator = events.NegativeBinomial(dict(n=n, p=p))
+
+            cdf = generator.count_cdf()
+            self.assertLess(1 - cdf[-1], 1e-12)
+            self.assertGreater(
+                generator.inverse_number_of_events(1 - 1e-9),
+                generator.inverse_number_of_events(1 - 1e-6))
+
+    def test_degenerate_counts(self):
+        """ Distributions with no events give zero, without warnings """
+        with np.errstate(all='raise'):
+            for generator in (events.Poisson(dict(frequency=0.0)),
+                              events.NegativeBinomial(dict(n=2, p=1.0))):
+                cdf = generator.count_cdf()
+                self.assertFalse(np.isnan(cdf).any())
+                self.assertEqual(
+                    generator.inverse_number_of_events(0.999), 0)
+
+    def test_abstract_count_distribution(self):
+        """ Count distributions must give their pmf """
+        with self.assertRaises(TypeError):
+            events.CountDistribution()
+
+    def test_invalid_sampling(self):
+
+        everest = make_everest()
+
+        with self.assertRaises(ValueError):
+            list(everest.generate_trials(end=10, sampling='sobol'))
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -43,6 +43,20 @@ class TestWeightedReservoir(unittest.TestCase):
         self.assertTrue(expect == observe)
 
 
+    def test_bit_generator(self):
+        """ Sampling works the same way with a bit generator """
+        size = 20
+        data = [(x + 1, x) for x in range(size)]
+
+        samples = []
+        for repeat in range(2):
+            res = ladybower.WeightedReservoir(
+                data, seed=1, bit_generator='pcg64')
+            samples.append(list(res.isample_without_replacement(5)))
+
+        self.assertEqual(samples[0], samples[1])
+        self.assertEqual(len(set(samples[0])), 5)
+
     def test_invalid_input(self):
         """ Exception thrown if invalid parameters """
         size = 10
@@ -54,7 +68,103 @@ class TestWeightedReservoir(unittest.TestCase):
             sample = res.isample_without_replacement(size + 1)
             
         self.assertEqual(cm.exception.args[0], "Sample size should be <= 10")
-        
+
+    def test_isample_many_without_replacement(self):
+        """ Ragged samples for a block of trials
+
+        Each trial gets the requested number of distinct indices,
+        whatever the chunk size.
+        """
+        size = 20
+        data = [(x + 1, x) for x in range(size)]
+        ks = [3, 0, size, 1, 7] * 10
+
+        for chunk_size in (1, 50, 2**20):
+            res = ladybower.WeightedReservoir(data, seed=0)
+
+            offsets, indices = res.isample_many_without_replacement(
+                ks, chunk_size=chunk_size)
+
+            self.assertEqual(len(offsets), len(ks) + 1)
+            for trial, k in enumerate(ks):
+                sample = indices[offsets[trial]:offsets[trial + 1]]
+                self.assertEqual(len(sample), k)
+                self.assertEqual(len(set(sample)), k)
+
+        # all of them, when k == n
+        sample = indices[offsets[2]:offsets[3]]
+        self.assertEqual(set(sample), set(range(size)))
+
+    def test_isample_many_weighting(self):
+        """ Heavier items are included more often
+
+        Inclusion frequencies should match those from
+        isample_without_replacement.
+        """
+        size = 10
+        trials = 4000
+        data = [(x + 1, x) for x in range(size)]
+
+        res = ladybower.WeightedReservoir(data, seed=0)
+        offsets, indices = res.isample_many_without_replacement(
+            [3] * trials, chunk_size=1000)
+        many = collections.Counter(indices)
+
+        res = ladybower.WeightedReservoir(data, seed=1)
+        single = collections.Counter()
+        for trial in range(trials):
+            single.update(res.isample_without_replacement(3))
+
+        # ordered by weight, at least comparing items well apart
+        for ix in range(size - 3):
+            self.assertLess(many[ix], many[ix + 3])
+
+        for ix in range(size):
+            self.assertAlmostEqual(many[ix] / trials, single[ix] / trials,
+                                   delta=0.05)
+
+    def test_isample_many_large_catalogue(self):
+        """ More weights than chunk_size, so keys come in column slices
+
+        Samples should be valid, and follow the weights just as when
+        whole rows of keys fit in a chunk.
+        """
+        size = 200
+        trials = 2000
+        data = [(x + 1, x) for x in range(size)]
+        ks = [5] * trials
+
+        frequencies = []
+        for chunk_size in (16, 2**20):
+            res = ladybower.WeightedReservoir(data, seed=2)
+            offsets, indices = res.isample_many_without_replacement(
+                ks, chunk_size=chunk_size)
+
+            for trial in range(trials):
+                sample = indices[offsets[trial]:offsets[trial + 1]]
+                self.assertEqual(len(set(sample)), 5)
+
+            frequencies.append(collections.Counter(indices))
+
+        small, large = frequencies
+        for ix in range(0, size, 20):
+            self.assertAlmostEqual(small[ix] / trials, large[ix] / trials,
+                                   delta=0.03)
+        self.assertLess(small[0] + small[1] + small[2],
+                        small[197] + small[198] + small[199])
+
+    def test_isample_many_invalid_input(self):
+        """ Exception thrown if any sample size is too big """
+        size = 10
+        data = [(x + 1, x) for x in range(size)]
+
+        res = ladybower.WeightedReservoir(data, seed=1)
+
+        with self.assertRaises(ValueError) as cm:
+            res.isample_many_without_replacement([1, size + 1])
+
+        self.assertEqual(cm.exception.args[0], "Sample size should be <= 10")
+
 
 if __name__ == '__main__':
 